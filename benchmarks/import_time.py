@@ -0,0 +1,77 @@
+"""
+benchmark the cost of `import FITSImageQA`
+
+Each measurement runs in a fresh interpreter, so module caches do not carry over.
+The "eager" case imports the heavy dependencies that the package originally loaded
+at import time (matplotlib.pyplot, sep, astropy.table, astropy.io.fits),
+i.e., the cost that is now deferred until a feature needs them.
+
+usage:
+    python benchmarks/import_time.py [--repeat N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+LAZY = "import FITSImageQA"
+EAGER = "import FITSImageQA, matplotlib.pyplot, sep, astropy.table, astropy.io.fits"
+
+TIMER = """
+import time
+t0 = time.perf_counter()
+{stmt}
+print(time.perf_counter() - t0)
+"""
+
+
+def time_import(stmt: str, repeat: int = 5) -> list[float]:
+    """
+    Time an import statement in `repeat` fresh interpreters
+
+    Parameters
+    ----------
+    stmt : str
+        import statement to time
+    repeat : int
+        number of interpreters to start
+
+    Returns
+    -------
+    times : list of float
+        wall-clock import time of each run, in seconds
+    """
+    env = {**os.environ, "PYTHONPATH": str(SRC)}
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", TIMER.format(stmt=stmt)],
+                             capture_output=True, text=True, check=True,
+                             env=env)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # warm the OS file cache
+    time_import(EAGER, repeat=1)
+
+    lazy = statistics.median(time_import(LAZY, args.repeat))
+    eager = statistics.median(time_import(EAGER, args.repeat))
+    print(f"import FITSImageQA (lazy):          {lazy * 1e3:8.1f} ms")
+    print(f"  + heavy dependencies (eager):     {eager * 1e3:8.1f} ms")
+    print(f"speedup:                            {eager / lazy:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
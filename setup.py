@@ -27,7 +27,9 @@ setup(
       ],
     python_requires='>=3.7', 
     #keywords = 
-    #entry_points = 
+    entry_points = {
+        "console_scripts": ["fitsimageqa = FITSImageQA.service:main"],
+    },
 
 
 
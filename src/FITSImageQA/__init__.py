@@ -1,10 +1,23 @@
 __version__ = "0.0.1"
 
-### not needed
-#from . import imageqa
-from .imageqa import *
-
-# not sure yet how the following line should be organized, since it is nested
-from . import detection 
-#from .detection import *
-#import detection
+# Submodules and the main classes are loaded on first access (PEP 562), so that
+# importing a light module (e.g., the `fitsimageqa` client in `service`) does
+# not also import numpy and the rest of `imageqa`.
+import importlib
+
+_submodules = ['imageqa', 'detection', 'preview', 'service', 'summary']
+_imageqa_names = ['ImageQA', 'QAHeader', 'QAData']
+
+__all__ = _submodules + _imageqa_names
+
+
+def __getattr__(name):
+    if name in _submodules:
+        return importlib.import_module(f'.{name}', __name__)
+    if name in _imageqa_names:
+        return getattr(importlib.import_module('.imageqa', __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
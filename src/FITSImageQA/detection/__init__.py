@@ -1,3 +1,4 @@
 # Unsure what this should look like
 
 from .detection import *
+from .crossmatch import *
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+# Standard library
+from dataclasses import dataclass
+
+# Third-party
+# scipy.spatial is imported inside `crossmatch_sources`
+import numpy as np
+
+
+__all__ = [
+    'SourceMatch',
+    'crossmatch_sources'
+]
+
+
+@dataclass
+class SourceMatch:
+    """Data class to hold the result of cross-matching two source catalogs."""
+    idx: np.ndarray
+    ref_idx: np.ndarray
+    dx: np.ndarray
+    dy: np.ndarray
+    sep: np.ndarray
+    inliers: np.ndarray
+    shift: tuple[float, float]
+    rotation: float
+    rms: float
+
+    def __len__(self) -> int:
+        return len(self.idx)
+
+
+def _xy(sources_or_cat) -> np.ndarray:
+    """
+    Collect the (x, y) pixel positions of a catalog as an (N, 2) float array.
+
+    Parameters
+    ----------
+    sources_or_cat : Sources or astropy.table.Table or np.ndarray
+        Object with a `cat` attribute (e.g., `Sources`), a table with
+        `x` and `y` columns, or an (N, 2) array of positions.
+
+    Returns
+    -------
+    np.ndarray
+    """
+    cat = getattr(sources_or_cat, 'cat', sources_or_cat)
+    if hasattr(cat, 'colnames') or getattr(getattr(cat, 'dtype', None), 'names', None):
+        xy = np.column_stack([np.asarray(cat['x'], dtype=float),
+                              np.asarray(cat['y'], dtype=float)])
+    else:
+        xy = np.asarray(cat, dtype=float)
+    if xy.ndim != 2 or xy.shape[1] != 2:
+        raise ValueError("Source positions must have shape (N, 2).")
+    return xy
+
+
+def _fit_rigid(ref_xy: np.ndarray, xy: np.ndarray):
+    """
+    Least-squares rotation and shift mapping `ref_xy` onto `xy`.
+
+    Parameters
+    ----------
+    ref_xy, xy : np.ndarray
+        Matched (N, 2) positions.
+
+    Returns
+    -------
+    theta : float
+        Rotation angle in radians (counter-clockwise).
+    shift : np.ndarray
+        Translation applied after rotating about the origin.
+    """
+    ref_mean = ref_xy.mean(axis=0)
+    mean = xy.mean(axis=0)
+    p = ref_xy - ref_mean
+    q = xy - mean
+    theta = np.arctan2(np.sum(p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]),
+                       np.sum(p[:, 0] * q[:, 0] + p[:, 1] * q[:, 1]))
+    cos, sin = np.cos(theta), np.sin(theta)
+    rot = np.array([[cos, -sin], [sin, cos]])
+    shift = mean - rot @ ref_mean
+    return theta, shift
+
+
+def crossmatch_sources(
+    sources,
+    reference,
+    max_sep: float = 3.0,
+    initial_shift: tuple[float, float] = (0.0, 0.0),
+    clip_sigma: float = 3.0,
+    max_iter: int = 5,
+    workers: int = -1,
+    logger=None
+) -> SourceMatch:
+    """
+    Cross-match a source catalog against a reference catalog.
+
+    Nearest neighbours are found with a KD-tree built on the reference
+    positions, so the cost is O(N log N) rather than O(N^2). Each reference
+    source is matched at most once (the closest candidate wins). A rigid
+    transform (rotation + shift) is then fit to the matched pairs, iteratively
+    rejecting outliers.
+
+    Parameters
+    ----------
+    sources : Sources or astropy.table.Table or np.ndarray
+        Catalog to be matched (e.g., the current frame).
+    reference : Sources or astropy.table.Table or np.ndarray
+        Reference catalog (e.g., the previous frame).
+    max_sep : float, optional
+        Maximum separation in pixels for a match, by default 3.0.
+    initial_shift : tuple of float, optional
+        Expected (dx, dy) offset of `sources` relative to `reference`,
+        by default (0, 0). Useful if the drift is larger than `max_sep`.
+    clip_sigma : float, optional
+        Outlier rejection threshold for the transform fit, in units of the
+        robust (MAD-based) scatter of the residuals, by default 3.0.
+    max_iter : int, optional
+        Maximum number of clipping iterations, by default 5.
+    workers : int, optional
+        Number of threads used for the KD-tree query, by default -1 (all).
+    logger : logging.Logger, optional
+        If given, log a summary of the match.
+
+    Returns
+    -------
+    match : SourceMatch
+        Indices of matched pairs into `sources` (`idx`) and `reference`
+        (`ref_idx`), their offsets (`dx`, `dy`, `sep`), the inlier mask used
+        in the fit, and the fitted `shift` (pixels), `rotation` (degrees,
+        counter-clockwise) and `rms` residual (pixels). With a single
+        match, only the shift is estimated and `rotation` is NaN.
+
+    Examples
+    --------
+    A known shift and rotation are recovered:
+
+    >>> rng = np.random.default_rng(1)
+    >>> ref = rng.uniform(0, 1000, (500, 2))
+    >>> theta = np.radians(0.05)
+    >>> rot = np.array([[np.cos(theta), -np.sin(theta)], [np.sin(theta), np.cos(theta)]])
+    >>> match = crossmatch_sources(ref @ rot.T + [2.0, -1.5], ref, initial_shift=(2, -1.5))
+    >>> [round(v, 3) for v in match.shift], round(match.rotation, 3)
+    ([2.0, -1.5], 0.05)
+
+    Each reference source is matched at most once (the closest candidate wins):
+
+    >>> match = crossmatch_sources([[0.0, 0.0], [0.5, 0.0], [10.0, 10.0]], [[0.1, 0.0], [10.0, 10.0]])
+    >>> match.idx.tolist(), match.ref_idx.tolist()
+    ([0, 2], [0, 1])
+
+    A single match gives the shift, but no rotation:
+
+    >>> match = crossmatch_sources([[10.5, 20.25]], [[10.0, 20.0], [50.0, 50.0]])
+    >>> match.shift, match.rotation
+    ((0.5, 0.25), nan)
+
+    Empty catalogs give no matches:
+
+    >>> match = crossmatch_sources(np.empty((0, 2)), ref)
+    >>> len(match), match.shift
+    (0, (nan, nan))
+    """
+    from scipy.spatial import cKDTree
+
+    xy = _xy(sources)
+    ref_xy = _xy(reference)
+    empty = np.array([], dtype=int)
+
+    if len(xy) == 0 or len(ref_xy) == 0:
+        return SourceMatch(idx=empty, ref_idx=empty, dx=np.array([]),
+                           dy=np.array([]), sep=np.array([]),
+                           inliers=np.array([], dtype=bool),
+                           shift=(np.nan, np.nan), rotation=np.nan, rms=np.nan)
+
+    # Find the nearest reference source for every source.
+    tree = cKDTree(ref_xy)
+    dist, ref_idx = tree.query(xy - np.asarray(initial_shift, dtype=float), k=1,
+                               distance_upper_bound=max_sep, workers=workers)
+    idx = np.flatnonzero(np.isfinite(dist))
+    ref_idx = ref_idx[idx]
+
+    # Keep only the closest candidate for each reference source.
+    order = np.argsort(dist[idx], kind='stable')
+    _, first = np.unique(ref_idx[order], return_index=True)
+    keep = np.sort(order[first])
+    idx, ref_idx = idx[keep], ref_idx[keep]
+
+    offsets = xy[idx] - ref_xy[ref_idx]
+    dx, dy = offsets[:, 0], offsets[:, 1]
+    sep = np.hypot(dx, dy)
+
+    # Fit a rigid transform, iteratively clipping outliers.
+    inliers = np.ones(len(idx), dtype=bool)
+    theta, shift, rms = np.nan, np.full(2, np.nan), np.nan
+    if len(idx) == 1:
+        # Too few pairs to fit a rotation: the offset is the shift.
+        shift = np.array([np.median(dx), np.median(dy)])
+        rms = 0.0
+    for _ in range(max_iter):
+        if inliers.sum() < 2:
+            break
+        theta, shift = _fit_rigid(ref_xy[ref_idx[inliers]], xy[idx[inliers]])
+        cos, sin = np.cos(theta), np.sin(theta)
+        model = ref_xy[ref_idx] @ np.array([[cos, sin], [-sin, cos]]) + shift
+        resid = np.hypot(*(xy[idx] - model).T)
+        rms = np.sqrt(np.mean(resid[inliers]**2))
+        scatter = 1.4826 * np.median(np.abs(resid[inliers] - np.median(resid[inliers])))
+        new_inliers = resid <= np.median(resid[inliers]) + clip_sigma * max(scatter, 1e-6)
+        if np.array_equal(new_inliers, inliers):
+            break
+        inliers = new_inliers
+
+    if logger is not None:
+        logger.info(f'{len(idx)} of {len(xy)} sources matched ({inliers.sum()} used in fit).')
+
+    return SourceMatch(
+        idx=idx,
+        ref_idx=ref_idx,
+        dx=dx,
+        dy=dy,
+        sep=sep,
+        inliers=inliers,
+        shift=(float(shift[0]), float(shift[1])),
+        rotation=float(np.degrees(theta)),
+        rms=float(rms),
+    )
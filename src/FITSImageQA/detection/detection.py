@@ -1,13 +1,21 @@
 from __future__ import annotations
 
 # Standard library
+import logging
+import threading
 from pathlib import Path
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
 # Third-party
-import sep
+# sep and astropy.table are imported inside `extract_sources`,
+# so that importing the package does not pay for them
 import numpy as np
-from astropy.table import Table
+if TYPE_CHECKING:
+    from astropy.table import Table
+
+# Project
+from .crossmatch import crossmatch_sources, SourceMatch
 
 ### Inherited from existing example:
 # Project
@@ -16,11 +24,26 @@ from astropy.table import Table
 #from ..log import logger
 
 
-sep.set_extract_pixstack(500000)
 default_kernel = np.array([[1,2,1], [2,4,2], [1,2,1]])
 default_flux_aper = [2.5, 5, 10]
 default_flux_ann = [(3, 6), (5, 8)]
 
+# Limits of SEP's internal buffers. The pixel stack starts at a fraction of the
+# image size and grows on overflow, up to what fits in the memory budget.
+default_memory_budget = 256 * 2**20  # bytes
+default_pixstack_fraction = 0.1
+default_sub_object_limit = 1024
+max_sub_object_limit = 65536
+_min_pixstack = 1024  # floor for the initial pixel stack of tiny images
+_pixstack_entry_bytes = 32  # approximate memory per pixel-stack entry
+_position_columns = ['x', 'y', 'xmin', 'xmax', 'ymin', 'ymax',
+                     'xpeak', 'ypeak', 'xcpeak', 'ycpeak']
+
+# SEP's limits are process-wide, so setting them and running sep.extract
+# must happen atomically when several threads are doing detection.
+_sep_lock = threading.Lock()
+_log = logging.getLogger(__name__)
+
 
 __all__ = [
     'extract_sources'
@@ -64,12 +87,222 @@ def _byteswap(arr):
     return arr
 
 
+
+def _pixstack_limits(shape: tuple[int, int], memory_budget: int = default_memory_budget):
+    """
+    Size SEP's pixel stack from the image size and a memory budget.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Image shape.
+    memory_budget : int, optional
+        Maximum memory in bytes to spend on the pixel stack (a hard cap).
+
+    Returns
+    -------
+    pixstack : int
+        Initial pixel stack size: a fraction of the pixels, at least 
+        `_min_pixstack` but never more than the image or the budget.
+    max_pixstack : int
+        Largest pixel stack allowed when retrying.
+
+    Examples
+    --------
+    >>> _pixstack_limits((512, 512))
+    (26214, 262144)
+    >>> _pixstack_limits((4096, 4096), memory_budget=1600)
+    (50, 50)
+    """
+    npix = int(np.prod(shape))
+    max_pixstack = max(1, min(npix, memory_budget // _pixstack_entry_bytes))
+    pixstack = min(max(int(npix * default_pixstack_fraction), _min_pixstack), npix, max_pixstack)
+    return pixstack, max_pixstack
+
+
+def _sep_extract(data, thresh, err, mask, pixstack, sub_object_limit, **kwargs):
+    """
+    Run sep.extract with the given buffer limits, restoring the previous ones afterwards.
+    """
+    import sep
+
+    with _sep_lock:
+        old_pixstack = sep.get_extract_pixstack()
+        old_sub_object_limit = sep.get_sub_object_limit()
+        sep.set_extract_pixstack(int(pixstack))
+        sep.set_sub_object_limit(int(sub_object_limit))
+        try:
+            return sep.extract(data, thresh, err=err, mask=mask, **kwargs)
+        finally:
+            sep.set_extract_pixstack(old_pixstack)
+            sep.set_sub_object_limit(old_sub_object_limit)
+
+
+def _extract_adaptive(data, thresh, err, mask, pixstack, max_pixstack, 
+                      sub_object_limit, max_retries, tile_overlap, 
+                      retries, logger, **kwargs):
+    """
+    Run sep.extract, escalating the buffer limits on overflow and falling 
+    back to tiled extraction if the limits cannot grow further (or `max_retries` 
+    is used up).
+
+    Each retry is logged as a warning and appended to `retries`.
+
+    Returns
+    -------
+    cat : np.ndarray
+        Structured array of detections.
+    segmap : np.ndarray
+        Segmentation map.
+
+    Examples
+    --------
+    A pixel stack too small for this field escalates once (to the cap) 
+    and then falls back to tiles, whose results are stitched together:
+
+    >>> import logging
+    >>> rng = np.random.default_rng(0)
+    >>> data = rng.normal(0, 1, (256, 256)).astype(np.float32)
+    >>> yy, xx = np.mgrid[:256, :256]
+    >>> for x0, y0 in rng.uniform(10, 246, (40, 2)):
+    ...     data += 100 * np.exp(-((xx - x0)**2 + (yy - y0)**2) / 8)
+    >>> kwargs = dict(minarea=5, filter_kernel=default_kernel, segmentation_map=True)
+    >>> cat, _ = _sep_extract(data, 3.0, 1.0, None, 300000, default_sub_object_limit, **kwargs)
+    >>> retries = []
+    >>> tiled, segmap = _extract_adaptive(
+    ...     data, 3.0, 1.0, None, pixstack=100, max_pixstack=400,
+    ...     sub_object_limit=default_sub_object_limit, max_retries=3, tile_overlap=16,
+    ...     retries=retries, logger=logging.getLogger('doctest'), **kwargs)
+    >>> retries[:2]  # doctest: +NORMALIZE_WHITESPACE
+    ['Pixel stack overflow at 100; retrying with 400.', 
+     'Extraction of a 256x256 image failed after 1 retries (pixstack 400, sub-object limit 1024); retrying in 2x2 tiles.']
+    >>> bool(len(tiled) == len(cat) == segmap.max())
+    True
+
+    With no retries allowed, the limits are not escalated and the image 
+    goes straight to tiles:
+
+    >>> retries = []
+    >>> _ = _extract_adaptive(
+    ...     data, 3.0, 1.0, None, pixstack=400, max_pixstack=1600,
+    ...     sub_object_limit=default_sub_object_limit, max_retries=0, tile_overlap=16,
+    ...     retries=retries, logger=logging.getLogger('doctest'), **kwargs)
+    >>> retries  # doctest: +NORMALIZE_WHITESPACE
+    ['Extraction of a 256x256 image failed after 0 retries (pixstack 400, sub-object limit 1024); retrying in 2x2 tiles.']
+    """
+    attempt = 0
+    while True:
+        try:
+            return _sep_extract(data, thresh, err, mask, pixstack, sub_object_limit, **kwargs)
+        except Exception as e:
+            error = e
+            msg = str(e)
+            if 'pixel buffer full' in msg or 'pixel stack' in msg:
+                overflow = 'pixstack'
+            elif 'sub-objects' in msg:
+                overflow = 'sub_object_limit'
+            else:
+                raise
+        # Only report a retry that will actually run.
+        if attempt >= max_retries:
+            break
+        if overflow == 'pixstack':
+            if pixstack >= max_pixstack:
+                break
+            new_pixstack = min(4 * pixstack, max_pixstack)
+            retry = f'Pixel stack overflow at {pixstack}; retrying with {new_pixstack}.'
+            pixstack = new_pixstack
+        else:
+            if sub_object_limit >= max_sub_object_limit:
+                break
+            new_limit = min(4 * sub_object_limit, max_sub_object_limit)
+            retry = f'Sub-object limit reached at {sub_object_limit}; retrying with {new_limit}.'
+            sub_object_limit = new_limit
+        logger.warning(retry)
+        retries.append(retry)
+        attempt += 1
+
+    # The limits cannot grow further: split the image into 2x2 tiles.
+    if min(data.shape) < 4 * tile_overlap:
+        raise error
+    retry = (f'Extraction of a {data.shape[1]}x{data.shape[0]} image failed after {attempt} '
+             f'retries (pixstack {pixstack}, sub-object limit {sub_object_limit}); retrying in 2x2 tiles.')
+    logger.warning(retry)
+    retries.append(retry)
+    return _extract_tiled(data, thresh, err, mask, pixstack, max_pixstack, 
+                          sub_object_limit, max_retries, tile_overlap, 
+                          retries, logger, **kwargs)
+
+
+def _extract_tiled(data, thresh, err, mask, pixstack, max_pixstack, 
+                   sub_object_limit, max_retries, tile_overlap, 
+                   retries, logger, **kwargs):
+    """
+    Extract sources in 2x2 overlapping tiles and stitch the results.
+
+    A source is kept by the tile whose core (the tile without the overlap)
+    contains its centroid. The segmentation map is assembled from the tile cores.
+    """
+    ny, nx = data.shape
+    ycuts, xcuts = [0, ny // 2, ny], [0, nx // 2, nx]
+    segmap = np.zeros(data.shape, dtype=np.int32)
+    cats = []
+    nsources = 0
+    for y0, y1 in zip(ycuts[:-1], ycuts[1:]):
+        for x0, x1 in zip(xcuts[:-1], xcuts[1:]):
+            sy = slice(max(0, y0 - tile_overlap), min(ny, y1 + tile_overlap))
+            sx = slice(max(0, x0 - tile_overlap), min(nx, x1 + tile_overlap))
+            tile_err = np.ascontiguousarray(err[sy, sx]) if np.ndim(err) == 2 else err
+            tile_mask = None if mask is None else np.ascontiguousarray(mask[sy, sx])
+            cat, tile_segmap = _extract_adaptive(
+                np.ascontiguousarray(data[sy, sx]), thresh, tile_err, tile_mask, 
+                pixstack, max_pixstack, sub_object_limit, max_retries, tile_overlap, 
+                retries, logger, **kwargs
+            )
+
+            # Move positions to the frame of the full image.
+            for col in _position_columns:
+                if col in cat.dtype.names:
+                    cat[col] += sx.start if col.startswith('x') else sy.start
+            keep = ((cat['x'] >= x0 - 0.5) & (cat['x'] < x1 - 0.5) &
+                    (cat['y'] >= y0 - 0.5) & (cat['y'] < y1 - 0.5))
+
+            # Relabel segments to match the stitched catalog; drop the others.
+            seg_ids = np.zeros(len(cat) + 1, dtype=np.int32)
+            seg_ids[1:][keep] = nsources + np.arange(1, keep.sum() + 1)
+            core = tile_segmap[y0 - sy.start:y1 - sy.start, x0 - sx.start:x1 - sx.start]
+            segmap[y0:y1, x0:x1] = seg_ids[core]
+
+            cats.append(cat[keep])
+            nsources += keep.sum()
+
+    return np.concatenate(cats), segmap
+
+
 @dataclass
 class Sources:
     """Data class to hold a source catalog and its associated segmentation map."""
     cat: Table
     segmap: np.ndarray
 
+    def crossmatch(self, reference, **kwargs) -> SourceMatch:
+        """
+        Cross-match this catalog against a reference catalog
+        (e.g., the previous frame).
+
+        Parameters
+        ----------
+        reference : Sources or astropy.table.Table or np.ndarray
+            Reference catalog.
+        **kwargs
+            Arguments for crossmatch.crossmatch_sources.
+
+        Returns
+        -------
+        match : SourceMatch
+        """
+        return crossmatch_sources(self, reference, **kwargs)
+
 
 def extract_sources(
     path_or_pixels: np.ndarray, #Path | str | np.ndarray, 
@@ -90,6 +323,11 @@ def extract_sources(
     flux_aper: list[float] = default_flux_aper,
     flux_ann: list[tuple[float, float]] = default_flux_ann,
     zpt=None,
+    memory_budget: int = default_memory_budget,
+    pixstack: int = None,
+    sub_object_limit: int = default_sub_object_limit,
+    max_retries: int = 3,
+    tile_overlap: int = 64,
     logger=None,
     **kwargs
 ):
@@ -144,6 +382,24 @@ def extract_sources(
         Inner and outer radii for flux annuli, by default [(3, 6), (5, 8)].
     zpt : float, optional
         Photometric zero point. If not None, magnitudes will be calculated.
+    memory_budget : int, optional
+        Maximum memory in bytes for SEP's pixel stack, by default 256 MB.
+        This caps the pixel stack, including any retries; beyond it the 
+        image is processed in tiles.
+    pixstack : int, optional
+        Initial size of SEP's pixel stack (capped by `memory_budget`). If None 
+        (default), sized from the image (10% of the pixels, at least 1024).
+    sub_object_limit : int, optional
+        Initial limit on the number of sub-objects when deblending, by default 1024.
+    max_retries : int, optional
+        Number of retries with escalated limits after a buffer overflow, 
+        by default 3. If the limits cannot grow further, the image is 
+        processed in overlapping tiles instead.
+    tile_overlap : int, optional
+        Overlap in pixels between tiles in the tiled fallback, by default 64.
+    logger : logging.Logger, optional
+        If given, report the number of detections and any retries. 
+        Retries are otherwise reported through this module's logger.
     **kwargs
         Arguments for sep.Background. 
 
@@ -151,7 +407,11 @@ def extract_sources(
     -------
     source : Sources
         Source object with `cat` and `segmap` as attributes. 
+        Any overflow retries are listed in `cat.meta['retries']`.
     """
+    import sep
+    from astropy.table import Table
+
     # Inherited from existing example: more flexible inputs allowable
     #pixels = io.load_pixels(path_or_pixels)
     pixels = path_or_pixels
@@ -170,12 +430,25 @@ def extract_sources(
     if subtract_sky:
         data = data - bkg
 
-    # Extract sources using sep.
-    cat, segmap = sep.extract(
+    # Size SEP's buffers from the image and memory budget.
+    init_pixstack, max_pixstack = _pixstack_limits(data.shape, memory_budget)
+    if pixstack is not None:
+        init_pixstack = min(pixstack, max_pixstack)
+
+    # Extract sources using sep, retrying on buffer overflows.
+    retries = []
+    cat, segmap = _extract_adaptive(
         data, 
         thresh,  
-        err=bkg.rms(),
-        mask=mask, 
+        bkg.rms(),
+        mask, 
+        pixstack=init_pixstack,
+        max_pixstack=max_pixstack,
+        sub_object_limit=sub_object_limit,
+        max_retries=max_retries,
+        tile_overlap=tile_overlap,
+        retries=retries,
+        logger=_log if logger is None else logger,
         minarea=minarea, 
         filter_kernel=filter_kernel, 
         filter_type=filter_type,
@@ -191,6 +464,7 @@ def extract_sources(
 
     # Convert catalog to astropy table.
     cat = Table(cat)
+    cat.meta['retries'] = retries
     
     # Save segment IDs for future reference.
     cat['seg_id'] = np.arange(1, len(cat) + 1, dtype=int)
@@ -10,9 +10,13 @@ from __future__ import annotations
 
 # imports:
 import numpy as np
-from astropy.io import fits
 import logging
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING
+
+# heavy dependencies (astropy.io.fits, matplotlib) are imported where they are used,
+# so that `import FITSImageQA` stays cheap for short-lived jobs
+if TYPE_CHECKING:
+    from astropy.io import fits
 
 # package imports
 # TODO: not sure how these should be organized...
@@ -57,6 +61,7 @@ class ImageQA:
 
         TODO: fill in
         """
+        from astropy.io import fits
         try:
             _ = fits.open(self.fn)
             self.is_corrupt = False
@@ -86,6 +91,7 @@ class QAHeader(ImageQA):
             if passing str or HDUList to `filename_or_hdr`, will create QAData directly
             otherwise, must explicitly pass a QAData object        
         """
+        from astropy.io import fits
         super().__init__()
         # parse the header, depending on what is passed
         if isinstance(filename_or_hdr, str):
@@ -285,6 +291,7 @@ class QAData(ImageQA):
             if passing str or HDUList to `filename_or_data`, will create QAHeader directly
             otherwise, must explicitly pass a QAHeader object   
         """
+        from astropy.io import fits
         super().__init__()
         # parse the data, depending on what is passed
         if isinstance(filename_or_data, str):
@@ -406,25 +413,73 @@ class QAData(ImageQA):
         add_detections : (bool)
             overplot sources detected via the `detect_sources` method
         kwargs (optional)
-            passed to <INSERT_PLOTTING_FUNCTION>
+            passed to matplotlib.axes.Axes.imshow
 
         Returns
         -------
-        fig : <INSERT_PLOTTING_FUNCTION> 
+        fig : matplotlib.figure.Figure
+
+        Notes
+        -----
+        This uses pyplot and the full-resolution image, for interactive use.
+        For batch processing (e.g., thumbnails) use `save_preview` instead.
 
         """
         if add_detections:
             try:
                 _ = self.sources 
-                raise NotImplementedError("Overplotting source detection functionality has been added yet") 
             except AttributeError:
                 self.logger.warning("Sources have not yet been extracted. " +\
                                     "Automatically calling `detect_sources` with default parameters, prior to plotting.")
                 self.detect_sources()
 
+        import matplotlib.pyplot as plt
+        from . import preview
+
         fig = plt.figure()
-        plt.imshow(self.data, **kwargs)
+        ax = fig.gca()
+        ax.imshow(self.data, **kwargs)
+        if add_detections:
+            preview.add_source_ellipses(ax, self.sources)
             
         return fig
 
-    
\ No newline at end of file
+    def save_preview(self, filename, add_detections: bool = False, 
+                     max_size: int = 512, **kwargs):
+        """ 
+        Write a downsampled, zscale-stretched preview of the image (e.g., a PNG thumbnail)
+
+        Parameters
+        ----------
+        filename : str or pathlib.Path or file-like
+            output file; the format is inferred from the extension
+        add_detections : (bool)
+            overplot sources detected via the `detect_sources` method
+        max_size : int
+            maximum size of the preview in pixels
+        kwargs (optional)
+            passed to preview.render_preview
+
+        Returns
+        -------
+        fig : matplotlib.figure.Figure
+
+        Notes
+        -----
+        Rendering uses the object-oriented Agg backend (no pyplot), 
+        so no global figure state is kept between calls
+        """
+        from . import preview
+
+        sources = None
+        if add_detections:
+            try:
+                sources = self.sources
+            except AttributeError:
+                self.logger.warning("Sources have not yet been extracted. " +\
+                                    "Automatically calling `detect_sources` with default parameters, prior to plotting.")
+                self.detect_sources()
+                sources = self.sources
+
+        return preview.render_preview(self.data, filename=filename, sources=sources, 
+                                      max_size=max_size, **kwargs)
@@ -0,0 +1,180 @@
+"""
+fast, pyplot-free rendering of image previews (e.g., thumbnails for a QA web page)
+"""
+
+from __future__ import annotations
+
+# Third-party
+import numpy as np
+from astropy.visualization import ZScaleInterval
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import EllipseCollection
+from matplotlib.figure import Figure
+
+
+__all__ = [
+    'downsample',
+    'zscale_limits',
+    'add_source_ellipses',
+    'render_preview'
+]
+
+
+def downsample(data: np.ndarray, max_size: int = 512, method: str = 'mean'):
+    """
+    Reduce an image so that its largest dimension is at most `max_size`.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        2D image.
+    max_size : int, optional
+        Maximum number of pixels along either axis, by default 512.
+    method : str, optional
+        'mean' (default) block-averages the image, 'decimate' keeps
+        every n-th pixel (faster, but noisier).
+
+    Returns
+    -------
+    preview : np.ndarray
+        Downsampled image.
+    factor : int
+        Integer reduction factor applied along both axes.
+    """
+    factor = max(1, int(np.ceil(max(data.shape) / max_size)))
+    if factor == 1:
+        return data, factor
+    if method == 'decimate':
+        return data[::factor, ::factor], factor
+    if method != 'mean':
+        raise ValueError(f"Unknown downsampling method: {method}")
+    ny, nx = (data.shape[0] // factor) * factor, (data.shape[1] // factor) * factor
+    blocks = data[:ny, :nx].reshape(ny // factor, factor, nx // factor, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32), factor
+
+
+def zscale_limits(data: np.ndarray, n_samples: int = 1000, **kwargs):
+    """
+    Estimate IRAF-style zscale display limits from a sample of the pixels.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Image (typically already downsampled).
+    n_samples : int, optional
+        Number of pixels sampled, by default 1000.
+    **kwargs
+        Arguments for astropy.visualization.ZScaleInterval.
+
+    Returns
+    -------
+    vmin, vmax : float
+    """
+    return ZScaleInterval(n_samples=n_samples, **kwargs).get_limits(data)
+
+
+def add_source_ellipses(ax, sources, factor: int = 1, scale: float = 3.0,
+                        edgecolor: str = 'red', linewidth: float = 0.5, **kwargs):
+    """
+    Overplot detected sources as a single collection of ellipses.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        Axes showing the image.
+    sources : Sources or astropy.table.Table
+        Source catalog with `x`, `y`, `a`, `b` and `theta` columns
+        (as produced by detection.extract_sources).
+    factor : int, optional
+        Downsampling factor of the displayed image, by default 1.
+    scale : float, optional
+        Multiple of the semi-axes used for the ellipse size, by default 3.
+    edgecolor : str, optional
+        Ellipse color, by default 'red'.
+    linewidth : float, optional
+        Ellipse line width, by default 0.5.
+    **kwargs
+        Arguments for matplotlib.collections.EllipseCollection.
+
+    Returns
+    -------
+    collection : matplotlib.collections.EllipseCollection
+    """
+    cat = getattr(sources, 'cat', sources)
+    # pixel centers of the full image, in the coordinates of the downsampled image
+    x = (np.asarray(cat['x']) + 0.5) / factor - 0.5
+    y = (np.asarray(cat['y']) + 0.5) / factor - 0.5
+    collection = EllipseCollection(
+        widths=2 * scale * np.asarray(cat['a']) / factor,
+        heights=2 * scale * np.asarray(cat['b']) / factor,
+        angles=np.degrees(np.asarray(cat['theta'])),
+        units='xy',
+        offsets=np.column_stack([x, y]),
+        offset_transform=ax.transData,
+        facecolors='none',
+        edgecolors=edgecolor,
+        linewidths=linewidth,
+        **kwargs
+    )
+    ax.add_collection(collection)
+    return collection
+
+
+def render_preview(data: np.ndarray, filename=None, sources=None,
+                   max_size: int = 512, method: str = 'mean',
+                   vmin: float = None, vmax: float = None,
+                   n_samples: int = 1000, cmap: str = 'gray',
+                   dpi: int = 100, **kwargs):
+    """
+    Render a downsampled preview of an image with the Agg backend (no pyplot).
+
+    Parameters
+    ----------
+    data : np.ndarray
+        2D image.
+    filename : str or pathlib.Path or file-like (optional)
+        If given, write the preview (e.g., a PNG thumbnail) here.
+    sources : Sources or astropy.table.Table (optional)
+        If given, overplot the detections as ellipses.
+    max_size : int, optional
+        Maximum size of the preview in pixels, by default 512.
+    method : str, optional
+        Downsampling method, 'mean' (default) or 'decimate'.
+    vmin, vmax : float (optional)
+        Display limits. If not given, estimated with zscale.
+    n_samples : int, optional
+        Number of pixels sampled for the zscale estimate, by default 1000.
+    cmap : str, optional
+        Colormap, by default 'gray'.
+    dpi : int, optional
+        Resolution of the figure, by default 100.
+    **kwargs
+        Arguments for add_source_ellipses.
+
+    Returns
+    -------
+    fig : matplotlib.figure.Figure
+        Figure (attached to an Agg canvas) holding the preview.
+    """
+    preview, factor = downsample(data, max_size=max_size, method=method)
+    if vmin is None or vmax is None:
+        zmin, zmax = zscale_limits(preview, n_samples=n_samples)
+        vmin = zmin if vmin is None else vmin
+        vmax = zmax if vmax is None else vmax
+
+    # one image pixel per figure pixel, axes filling the whole figure
+    ny, nx = preview.shape
+    fig = Figure(figsize=(nx / dpi, ny / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.imshow(preview, origin='lower', cmap=cmap, vmin=vmin, vmax=vmax,
+              interpolation='nearest')
+    if sources is not None:
+        add_source_ellipses(ax, sources, factor=factor, **kwargs)
+        ax.set_xlim(-0.5, nx - 0.5)
+        ax.set_ylim(-0.5, ny - 0.5)
+
+    if filename is not None:
+        fig.savefig(filename, dpi=dpi)
+    return fig
@@ -0,0 +1,577 @@
+"""
+long-running QA service: a pool of warm worker processes behind a local socket,
+and the command-line client that submits frames to it
+
+Protocol: JSON lines. The client sends one request per line and the service
+answers with one JSON line per result, in order of completion. Requests:
+    {"cmd": "qa", "file": "/path/to/frame.fits", "options": {...}}
+    {"cmd": "stats"}
+    {"cmd": "shutdown"}
+When the client closes its side of the connection, the service finishes the
+outstanding jobs of that connection, streams their results and closes.
+
+usage:
+    fitsimageqa serve [--socket PATH | --port N] [--workers N]
+    fitsimageqa submit [--socket PATH | --port N] [options] FILE [FILE ...]
+    fitsimageqa submit ... -        (read filenames from stdin, one per line)
+    fitsimageqa submit ... --store DIR  (also append the results to a QA results store)
+    fitsimageqa summary DIR [--by KEY ...]
+    fitsimageqa stats
+    fitsimageqa shutdown
+"""
+
+from __future__ import annotations
+
+# Standard library
+# (concurrent.futures and multiprocessing are only needed by the service, and are
+# imported there, to keep the start-up of the `fitsimageqa` client short)
+import argparse
+import collections
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+__all__ = [
+    'qa_frame',
+    'QAService',
+    'submit',
+    'main'
+]
+
+logger = logging.getLogger(__name__)
+
+
+def default_socket_path() -> str:
+    """
+    Default location of the service socket (per user)
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir is None:
+        import tempfile
+        runtime_dir = tempfile.gettempdir()
+    return os.path.join(runtime_dir, f'fitsimageqa-{os.getuid()}.sock')
+
+
+def qa_frame(filename: str, max_focus_fwhm: float = 2.5,
+             expected_fields: list[str] = None,
+             header_keys: list[str] = None,
+             detection_config: dict = None) -> dict:
+    """
+    Run the standard QA checks on a single frame
+
+    Parameters
+    ----------
+    filename : str
+        path to the FITS file
+    max_focus_fwhm : float
+        maximum value of the FWHM, to consider the image to be in focus
+    expected_fields : iterable of str (optional)
+        fields that must appear in the image header
+    header_keys : iterable of str (optional)
+        header values to copy into the result (e.g., FILTER, EXPTIME)
+    detection_config : dict (optional)
+        parameters passed to `detection.extract_sources`
+
+    Returns
+    -------
+    result : dict
+        JSON-serializable summary of the checks: `file`, `mjd` (time of the
+        observation, from MJD-OBS or DATE-OBS), `header`, `nsources`, `fwhm`,
+        `in_focus`, `retries`, `header_valid`, `missing_fields`, `elapsed`
+    """
+    from astropy.io import fits
+    from .imageqa import QAData
+
+    t0 = time.perf_counter()
+    with fits.open(filename) as hdul:
+        qadata = QAData(hdul, detection_config=detection_config)
+        qadata.data = qadata.data.astype(float) # read the pixels before closing the file
+    result = {'file': filename, **_header_info(qadata.qahdr.hdr, header_keys)}
+    qadata.detect_sources()
+    in_focus, med_fwhm = qadata.is_focus_good(max_focus_fwhm=max_focus_fwhm)
+
+    result.update({
+        'nsources': len(qadata.sources.cat),
+        'fwhm': float(med_fwhm),
+        'in_focus': bool(in_focus),
+        'retries': len(qadata.sources.cat.meta.get('retries', [])),
+    })
+    if expected_fields is not None:
+        valid, missing = qadata.qahdr.check_header_fields_present(expected_fields, return_missing_fields=True)
+        result['header_valid'] = bool(valid)
+        result['missing_fields'] = sorted(missing)
+    result['elapsed'] = time.perf_counter() - t0
+    return result
+
+
+def _header_info(hdr, header_keys: list[str] = None) -> dict:
+    """
+    Entries of a QA result that only depend on the header, so that they can
+    also be reported for frames that fail (and be grouped with their night)
+    """
+    info = {}
+    mjd = _observation_mjd(hdr)
+    if mjd is not None:
+        info['mjd'] = mjd
+    if header_keys is not None:
+        info['header'] = {k: hdr.get(k) for k in header_keys}
+    return info
+
+
+def _observation_mjd(hdr) -> float | None:
+    """
+    Time of the observation as MJD, from MJD-OBS or DATE-OBS (and TIME-OBS)
+    """
+    if hdr.get('MJD-OBS') is not None:
+        try:
+            return float(hdr['MJD-OBS'])
+        except (TypeError, ValueError):
+            pass
+    date_obs = hdr.get('DATE-OBS')
+    if not isinstance(date_obs, str):
+        return None
+    if 'T' not in date_obs and isinstance(hdr.get('TIME-OBS'), str):
+        date_obs = f"{date_obs}T{hdr['TIME-OBS']}"
+    from astropy.time import Time
+    try:
+        return float(Time(date_obs.strip()).mjd)
+    except ValueError:
+        return None
+
+
+def _worker_init():
+    """
+    Import the heavy dependencies once per worker process
+    """
+    import sep
+    import astropy.io.fits
+    import astropy.table
+    from . import imageqa, detection
+
+
+def _warmup():
+    return os.getpid()
+
+
+def _run_job(filename: str, options: dict) -> dict:
+    """
+    Run `qa_frame` in a worker, returning failures as results instead of raising
+    """
+    try:
+        return qa_frame(filename, **options)
+    except Exception as e:
+        result = {'file': filename, 'error': f'{type(e).__name__}: {e}'}
+    try:
+        from astropy.io import fits
+        result.update(_header_info(fits.getheader(filename), options.get('header_keys')))
+    except Exception:
+        pass # the header is unreadable too
+    return result
+
+
+class QAService:
+    def __init__(self, workers: int = None) -> None:
+        """
+        Pool of warm QA worker processes, with queue and throughput bookkeeping
+
+        Parameters
+        ----------
+        workers : int (optional)
+            number of worker processes, by default the number of CPUs
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = self._make_pool()
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.started = time.time()
+        self._recent = collections.deque(maxlen=1000)
+
+    def _make_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        import concurrent.futures
+        import multiprocessing
+
+        # spawn (rather than fork) since the server is multi-threaded
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_worker_init
+        )
+
+    def warm_up(self, wait: bool = True):
+        """
+        Start all worker processes and import their dependencies
+
+        Parameters
+        ----------
+        wait : bool
+            wait until all workers are ready; otherwise they start in the background
+        """
+        import concurrent.futures
+
+        futures = [self.pool.submit(_warmup) for _ in range(self.workers)]
+        if wait:
+            concurrent.futures.wait(futures)
+
+    def submit(self, filename: str, options: dict = None) -> concurrent.futures.Future:
+        """
+        Queue a frame for QA
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            resolves to the result dict of `qa_frame`
+        """
+        import concurrent.futures
+
+        with self._lock:
+            try:
+                future = self.pool.submit(_run_job, filename, options or {})
+            except concurrent.futures.process.BrokenProcessPool:
+                # a worker died (e.g., a crash in SEP); jobs that were running in
+                # the old pool fail individually, new jobs go to a fresh pool
+                logger.warning('Worker pool is broken; restarting it.')
+                self.pool.shutdown(wait=False)
+                self.pool = self._make_pool()
+                self.restarts += 1
+                future = self.pool.submit(_run_job, filename, options or {})
+                # start the remaining workers behind this job, so the next
+                # requests do not each pay for a cold start
+                self.warm_up(wait=False)
+            self.submitted += 1
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future):
+        failed = future.cancelled() or future.exception() is not None or 'error' in future.result()
+        with self._lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self._recent.append(time.time())
+
+    def stats(self) -> dict:
+        """
+        Queue depth and throughput of the service
+
+        Returns
+        -------
+        stats : dict
+            `queue_depth` (jobs submitted but not finished), job counters,
+            `throughput` since start and `recent_throughput` over the last minute
+            (frames per second)
+        """
+        now = time.time()
+        with self._lock:
+            finished = self.completed + self.failed
+            recent = sum(t > now - 60 for t in self._recent)
+            uptime = now - self.started
+            return {
+                'workers': self.workers,
+                'queue_depth': self.submitted - finished,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'restarts': self.restarts,
+                'uptime': uptime,
+                'throughput': finished / uptime if uptime > 0 else 0.0,
+                'recent_throughput': recent / min(60.0, uptime) if uptime > 0 else 0.0,
+            }
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle one client connection: read JSON-line requests, stream JSON-line results
+    """
+    def handle(self):
+        service = self.server.service
+        write_lock = threading.Lock()
+
+        def send(obj):
+            line = (json.dumps(obj, default=str) + '\n').encode()
+            with write_lock:
+                try:
+                    self.wfile.write(line)
+                except OSError:
+                    pass # client went away; the job still counts in the stats
+
+        # results are written from the futures' callbacks; count them so the
+        # connection is only closed once every result has been sent
+        sent = threading.Semaphore(0)
+        npending = 0
+
+        def send_result(future, filename):
+            try:
+                if future.cancelled():
+                    send({'file': filename, 'error': 'Cancelled'})
+                elif future.exception() is not None:
+                    e = future.exception()
+                    send({'file': filename, 'error': f'{type(e).__name__}: {e}'})
+                else:
+                    send(future.result())
+            finally:
+                sent.release()
+
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            try:
+                request = json.loads(raw)
+                cmd = request.get('cmd', 'qa')
+                if cmd == 'qa':
+                    filename = request['file']
+            except (ValueError, AttributeError, KeyError) as e:
+                send({'error': f'Invalid request: {e!r}'})
+                continue
+            if cmd == 'qa':
+                try:
+                    future = service.submit(filename, request.get('options'))
+                except Exception as e:
+                    send({'file': filename, 'error': f'{type(e).__name__}: {e}'})
+                    continue
+                future.add_done_callback(lambda f, filename=filename: send_result(f, filename))
+                npending += 1
+            elif cmd == 'stats':
+                send(service.stats())
+            elif cmd == 'shutdown':
+                send({'shutdown': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                break
+            else:
+                send({'error': f'Unknown command: {cmd}'})
+        for _ in range(npending):
+            sent.acquire()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _socket_in_use(socket_path: str) -> bool:
+    """
+    Is a service accepting connections on this Unix socket?
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    finally:
+        sock.close()
+
+
+def serve(socket_path: str = None, port: int = None, workers: int = None):
+    """
+    Run the QA service until a `shutdown` request (or KeyboardInterrupt)
+
+    Parameters
+    ----------
+    socket_path : str (optional)
+        Unix socket to listen on, by default `default_socket_path()`
+    port : int (optional)
+        if given, listen on localhost TCP instead of a Unix socket
+    workers : int (optional)
+        number of worker processes
+
+    Raises
+    ------
+    RuntimeError
+        if another service is already listening on `socket_path`
+        (a socket file left behind by a service that died is replaced)
+    """
+    if port is None:
+        socket_path = socket_path or default_socket_path()
+        if os.path.exists(socket_path):
+            if _socket_in_use(socket_path):
+                raise RuntimeError(f'A QA service is already listening on {socket_path}.')
+            os.unlink(socket_path) # stale socket from a previous run
+
+    service = QAService(workers=workers)
+    service.warm_up()
+    if port is not None:
+        server = _TCPServer(('127.0.0.1', port), _RequestHandler)
+        address = f'127.0.0.1:{port}'
+    else:
+        server = _UnixServer(socket_path, _RequestHandler)
+        address = socket_path
+    server.service = service
+    logger.info(f'QA service listening on {address} with {service.workers} workers.')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if port is None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def _connect(socket_path: str = None, port: int = None) -> socket.socket:
+    if port is not None:
+        return socket.create_connection(('127.0.0.1', port))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path or default_socket_path())
+    return sock
+
+
+def submit(requests, socket_path: str = None, port: int = None):
+    """
+    Send requests to the QA service and yield its responses as they arrive
+
+    Parameters
+    ----------
+    requests : iterable of dict
+        requests to send (may be a lazy iterable, e.g., reading stdin)
+    socket_path : str (optional)
+        Unix socket of the service
+    port : int (optional)
+        localhost TCP port of the service, instead of a Unix socket
+
+    Yields
+    ------
+    response : dict
+
+    Raises
+    ------
+    ConnectionError
+        if the service closed the connection before answering every request
+    """
+    sock = _connect(socket_path=socket_path, port=port)
+    nsent = 0
+
+    def send():
+        nonlocal nsent
+        try:
+            for request in requests:
+                sock.sendall((json.dumps(request) + '\n').encode())
+                nsent += 1
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass # the service closed the connection; reported below
+
+    sender = threading.Thread(target=send, daemon=True)
+    sender.start()
+    nreceived = 0
+    with sock, sock.makefile('r') as responses:
+        for line in responses:
+            nreceived += 1
+            yield json.loads(line)
+    sender.join()
+    if nreceived < nsent:
+        raise ConnectionError(f'The QA service answered {nreceived} of {nsent} requests.')
+
+
+def main(argv: list[str] = None):
+    """
+    Command-line entry point (`fitsimageqa`)
+    """
+    parser = argparse.ArgumentParser(prog='fitsimageqa', description='FITS image QA service.')
+    address = argparse.ArgumentParser(add_help=False)
+    address.add_argument('--socket', dest='socket_path', default=None,
+                         help='Unix socket of the service (default: one per user in $XDG_RUNTIME_DIR or /tmp)')
+    address.add_argument('--port', type=int, default=None,
+                         help='use localhost TCP on this port instead of a Unix socket')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', parents=[address], help='run the QA service')
+    serve_parser.add_argument('--workers', type=int, default=None)
+
+    submit_parser = commands.add_parser('submit', parents=[address],
+                                        help='submit frames; results are printed as JSON lines')
+    submit_parser.add_argument('files', nargs='+', help="FITS files, or '-' to read filenames from stdin")
+    submit_parser.add_argument('--max-fwhm', type=float, default=None)
+    submit_parser.add_argument('--expected-field', action='append', dest='expected_fields')
+    submit_parser.add_argument('--header-key', action='append', dest='header_keys')
+    submit_parser.add_argument('--store', default=None,
+                               help='also append the results to this QA results store (see summary.QAStore)')
+    submit_parser.add_argument('--store-batch', type=int, default=100,
+                               help='number of results per part written to the store')
+
+    commands.add_parser('stats', parents=[address], help='print queue depth and throughput')
+    commands.add_parser('shutdown', parents=[address], help='stop the QA service')
+
+    summary_parser = commands.add_parser('summary', help='summarize a QA results store')
+    summary_parser.add_argument('store')
+    summary_parser.add_argument('--by', action='append', default=None,
+                                help='header key to group by (repeatable), by default NIGHT')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        try:
+            serve(socket_path=args.socket_path, port=args.port, workers=args.workers)
+        except (RuntimeError, OSError) as e:
+            print(f'fitsimageqa: {e}', file=sys.stderr)
+            return 1
+        return 0
+
+    if args.command == 'summary':
+        from .summary import QAStore, nightly_summary
+        nightly_summary(QAStore(args.store), by=args.by or 'NIGHT').pprint_all()
+        return 0
+
+    store, batch = None, []
+    if args.command == 'submit':
+        if args.store is not None:
+            from .summary import QAStore
+            store = QAStore(args.store)
+        options = {}
+        if args.max_fwhm is not None:
+            options['max_focus_fwhm'] = args.max_fwhm
+        if args.expected_fields:
+            options['expected_fields'] = args.expected_fields
+        if args.header_keys:
+            options['header_keys'] = args.header_keys
+
+        def filenames():
+            for f in args.files:
+                if f == '-':
+                    yield from (os.path.abspath(line.strip()) for line in sys.stdin if line.strip())
+                else:
+                    yield os.path.abspath(f)
+
+        requests = ({'cmd': 'qa', 'file': f, 'options': options} for f in filenames())
+    else:
+        requests = [{'cmd': args.command}]
+
+    status = 0
+    try:
+        for response in submit(requests, socket_path=args.socket_path, port=args.port):
+            print(json.dumps(response), flush=True)
+            if 'error' in response:
+                status = 1
+            if store is not None and 'file' in response:
+                batch.append(response)
+                if len(batch) >= args.store_batch:
+                    store.append(batch)
+                    batch = []
+    except OSError as e:
+        print(f'fitsimageqa: {e}', file=sys.stderr)
+        status = 2
+    finally:
+        if store is not None and batch:
+            store.append(batch)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
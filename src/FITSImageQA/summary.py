@@ -0,0 +1,415 @@
+"""
+columnar storage of per-frame QA results, and nightly aggregate summaries
+
+Results (the dicts produced by `service.qa_frame`) are appended to a `QAStore`,
+a directory of compressed numpy archives with one array per column. Each append
+writes a new part, so the store grows without rewriting earlier frames, and
+reading a subset of columns only decompresses those columns.
+`QASummary` aggregates the results per group of header values (e.g., per night
+and filter), including the trend of the number of sources in time (e.g., clouds
+coming in), and can be updated incrementally as new frames arrive.
+"""
+
+from __future__ import annotations
+
+# Standard library
+import io
+import os
+import time
+from pathlib import Path
+
+# Third-party
+import numpy as np
+from astropy.table import Table, MaskedColumn, vstack
+
+
+__all__ = [
+    'results_to_table',
+    'QAStore',
+    'QASummary',
+    'nightly_summary'
+]
+
+
+def results_to_table(results: list[dict]) -> Table:
+    """
+    Flatten per-frame QA results into a table, one row per frame
+
+    Parameters
+    ----------
+    results : iterable of dict
+        results of `service.qa_frame` (failed frames have an `error` entry)
+
+    Returns
+    -------
+    table : astropy.table.Table
+        header values become their own (always string) columns, `missing_fields` 
+        becomes the count `nmissing`; entries absent from a result are masked,
+        and columns without any value are left out
+    """
+    rows = []
+    header_keys = set()
+    for result in results:
+        row = {k: v for k, v in result.items() if k not in ('header', 'missing_fields')}
+        if 'missing_fields' in result:
+            row['nmissing'] = len(result['missing_fields'])
+        header = result.get('header') or {}
+        header_keys.update(header)
+        row.update(header)
+        rows.append(row)
+
+    names = list(dict.fromkeys(k for row in rows for k in row))
+    table = Table()
+    for name in names:
+        values = [row.get(name) for row in rows]
+        mask = np.array([v is None for v in values])
+        if mask.all():
+            continue
+        present = np.array([v for v in values if v is not None])
+        # header values keep the same type across batches (e.g., NIGHT as 20261018 or '2026-10-18')
+        if name in header_keys or present.dtype.kind not in 'biufU':
+            present = present.astype(str)
+        data = np.zeros(len(values), dtype=present.dtype)
+        data[~mask] = present
+        table[name] = MaskedColumn(data, mask=mask) if mask.any() else data
+    return table
+
+
+def _slope_per_hour(mjd: np.ndarray, values: np.ndarray) -> float:
+    """
+    Slope of a least-squares line through `values` against time, per hour
+    """
+    if len(mjd) < 2 or np.ptp(mjd) == 0:
+        return np.nan
+    hours = (mjd - mjd.min()) * 24
+    return float(np.polyfit(hours, values, 1)[0])
+
+
+class QAStore:
+    def __init__(self, path: str | Path) -> None:
+        """
+        Directory of per-frame QA results, stored by column
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+            directory of the store (created if needed)
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def parts(self) -> list[Path]:
+        """
+        Parts of the store, oldest first
+        """
+        return sorted(self.path.glob('part-*.npz'))
+
+    def append(self, results: list[dict] | Table) -> Path:
+        """
+        Write a batch of results as a new part
+
+        Parameters
+        ----------
+        results : iterable of dict or astropy.table.Table
+            results of `service.qa_frame`, or a table from `results_to_table`
+
+        Returns
+        -------
+        part : pathlib.Path
+            file that was written
+        """
+        table = results if isinstance(results, Table) else results_to_table(results)
+        arrays = {}
+        for name in table.colnames:
+            col = table[name]
+            arrays[f'{name}.data'] = np.asarray(col)
+            if getattr(col, 'mask', None) is not None and np.any(col.mask):
+                arrays[f'{name}.mask'] = np.asarray(col.mask)
+
+        # write to a temporary file first, so readers never see a partial part
+        part = self.path / f'part-{time.time_ns():020d}-{os.getpid()}.npz'
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        tmp = part.with_suffix('.tmp')
+        tmp.write_bytes(buffer.getvalue())
+        os.replace(tmp, part)
+        return part
+
+    @staticmethod
+    def read_part(part: str | Path, columns: list[str] = None) -> Table:
+        """
+        Read (some of the columns of) a single part
+
+        Parameters
+        ----------
+        part : str or pathlib.Path
+        columns : iterable of str (optional)
+            columns to read; by default all columns
+
+        Returns
+        -------
+        table : astropy.table.Table
+        """
+        table = Table(masked=False)
+        with np.load(part, allow_pickle=False) as arrays:
+            names = [k[:-len('.data')] for k in arrays.files if k.endswith('.data')]
+            for name in names:
+                if columns is not None and name not in columns:
+                    continue
+                data = arrays[f'{name}.data']
+                if f'{name}.mask' in arrays.files:
+                    table[name] = MaskedColumn(data, mask=arrays[f'{name}.mask'])
+                else:
+                    table[name] = data
+        return table
+
+    def read(self, columns: list[str] = None, parts: list[Path] = None) -> Table:
+        """
+        Read the store (or some of its parts) into a single table
+
+        Parameters
+        ----------
+        columns : iterable of str (optional)
+            columns to read; by default all columns
+        parts : iterable of pathlib.Path (optional)
+            parts to read; by default all parts
+
+        Returns
+        -------
+        table : astropy.table.Table
+            columns missing from some parts are masked there
+
+        Examples
+        --------
+        Parts may disagree on the type of a column, and header values that are
+        never set (here FILTER) do not produce a column:
+
+        >>> import tempfile
+        >>> tmp = tempfile.TemporaryDirectory()
+        >>> store = QAStore(tmp.name)
+        >>> _ = store.append([{'file': 'a.fits', 'nsources': 10, 'header': {'NIGHT': 20261018, 'FILTER': None}}])
+        >>> _ = store.append(Table({'file': ['b.fits'], 'nsources': [12], 'NIGHT': [20261018]}))
+        >>> _ = store.append([{'file': 'c.fits', 'error': 'OSError', 'header': {'NIGHT': '2026-10-19', 'FILTER': None}}])
+        >>> table = store.read()
+        >>> table.colnames
+        ['file', 'nsources', 'NIGHT', 'error']
+        >>> table['NIGHT'].tolist(), table['nsources'].tolist()
+        (['20261018', '20261018', '2026-10-19'], [10, 12, None])
+        >>> tmp.cleanup()
+        """
+        parts = self.parts() if parts is None else parts
+        tables = [self.read_part(part, columns=columns) for part in parts]
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return Table()
+
+        # reconcile column types that differ between parts (e.g., a number in 
+        # one part and a string in another) by falling back to strings
+        names = {name for t in tables for name in t.colnames}
+        for name in names:
+            kinds = {t[name].dtype.kind for t in tables if name in t.colnames}
+            if len(kinds) > 1 and not kinds <= set('iuf'):
+                for t in tables:
+                    if name in t.colnames:
+                        t[name] = t[name].astype(str)
+        return vstack(tables, join_type='outer', metadata_conflicts='silent')
+
+    def compact(self) -> Path:
+        """
+        Merge all parts into a single part
+
+        Notes
+        -----
+        A `QASummary` that was updated from this store tracks parts by name,
+        so it must be rebuilt after compacting
+
+        Examples
+        --------
+        >>> import tempfile
+        >>> tmp = tempfile.TemporaryDirectory()
+        >>> store = QAStore(tmp.name)
+        >>> for i in range(3):
+        ...     _ = store.append([{'file': f'{i}.fits', 'nsources': i, 'header': {'NIGHT': 20261018}}])
+        >>> len(store.parts())
+        3
+        >>> _ = store.compact()
+        >>> len(store.parts()), store.read()['file'].tolist()
+        (1, ['0.fits', '1.fits', '2.fits'])
+        >>> tmp.cleanup()
+        """
+        parts = self.parts()
+        merged = self.append(self.read(parts=parts))
+        for part in parts:
+            part.unlink()
+        return merged
+
+
+class QASummary:
+    def __init__(self, by: str | list[str] = 'NIGHT') -> None:
+        """
+        Per-group aggregate of QA results, updated incrementally
+
+        Parameters
+        ----------
+        by : str or iterable of str
+            result columns (typically header keys, e.g. NIGHT and FILTER)
+            used to group the frames; frames without a value are grouped under ''
+        """
+        self.by = [by] if isinstance(by, str) else list(by)
+        self._groups = {}
+        self._seen_parts = set()
+
+    def update(self, results: list[dict] | Table) -> QASummary:
+        """
+        Add a batch of results to the summary
+
+        Parameters
+        ----------
+        results : iterable of dict or astropy.table.Table
+            results of `service.qa_frame`, or a table of them (e.g., from a `QAStore`)
+
+        Returns
+        -------
+        self : QASummary
+        """
+        table = results if isinstance(results, Table) else results_to_table(results)
+        if not len(table):
+            return self
+
+        def column(name, fill):
+            if name not in table.colnames:
+                return np.full(len(table), fill)
+            col = table[name]
+            data = np.asarray(col)
+            if getattr(col, 'mask', None) is not None:
+                data = np.where(col.mask, fill, data)
+            return data
+
+        keys = np.rec.fromarrays([column(k, '').astype(str) for k in self.by], names=self.by)
+        error = column('error', '').astype(str) != ''
+        fwhm = column('fwhm', np.nan).astype(float)
+        nsources = column('nsources', -1).astype(int)
+        mjd = column('mjd', np.nan).astype(float)
+        in_focus = column('in_focus', -1).astype(int)
+        header_valid = column('header_valid', -1).astype(int)
+
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        for i, key in enumerate(unique_keys):
+            rows = inverse.ravel() == i
+            ok = rows & ~error
+            group = self._groups.setdefault(tuple(key.tolist()), {
+                'nframes': 0, 'nfailed': 0, 'fwhm': [], 'nsources': [], 'mjd': [],
+                'nfocus': 0, 'nfocus_failed': 0, 'nheader': 0, 'nheader_failed': 0,
+            })
+            group['nframes'] += int(rows.sum())
+            group['nfailed'] += int((rows & error).sum())
+            group['fwhm'].append(fwhm[ok])
+            group['nsources'].append(nsources[ok & (nsources >= 0)])
+            group['mjd'].append(mjd[ok & (nsources >= 0)])
+            group['nfocus'] += int((ok & (in_focus >= 0)).sum())
+            group['nfocus_failed'] += int((ok & (in_focus == 0)).sum())
+            group['nheader'] += int((ok & (header_valid >= 0)).sum())
+            group['nheader_failed'] += int((ok & (header_valid == 0)).sum())
+        return self
+
+    def update_from_store(self, store: QAStore) -> QASummary:
+        """
+        Add the parts of a store that have not been summarized yet
+
+        Parameters
+        ----------
+        store : QAStore
+
+        Returns
+        -------
+        self : QASummary
+
+        Examples
+        --------
+        Parts that were already summarized are not counted again:
+
+        >>> import tempfile
+        >>> tmp = tempfile.TemporaryDirectory()
+        >>> store = QAStore(tmp.name)
+        >>> _ = store.append([{'file': 'a.fits', 'nsources': 10, 'header': {'NIGHT': 20261018}}])
+        >>> summary = QASummary(by='NIGHT').update_from_store(store)
+        >>> _ = store.append([{'file': 'b.fits', 'nsources': 12, 'header': {'NIGHT': 20261018}},
+        ...                   {'file': 'c.fits', 'error': 'OSError', 'header': {'NIGHT': 20261018}}])
+        >>> table = summary.update_from_store(store).update_from_store(store).table()
+        >>> table['NIGHT', 'nframes', 'nfailed', 'nsources_max'].pprint()
+         NIGHT   nframes nfailed nsources_max
+        -------- ------- ------- ------------
+        20261018       3       1           12
+        >>> tmp.cleanup()
+        """
+        columns = self.by + ['error', 'mjd', 'fwhm', 'nsources', 'in_focus', 'header_valid']
+        new_parts = [p for p in store.parts() if p.name not in self._seen_parts]
+        if new_parts:
+            self.update(store.read(columns=columns, parts=new_parts))
+            self._seen_parts.update(p.name for p in new_parts)
+        return self
+
+    def table(self) -> Table:
+        """
+        Summary table, one row per group
+
+        Returns
+        -------
+        table : astropy.table.Table
+            group keys, `nframes`, `nfailed` (frames that could not be processed),
+            median/min/max number of sources, `nsources_slope` (trend of the
+            number of sources in time, per hour; NaN without timed frames over
+            a time span), median FWHM, `focus_fail_rate` (fraction of checked
+            frames out of focus), `header_failures` and the time range of the
+            frames, `mjd_start` and `mjd_end`
+        """
+        rows = []
+        for key, group in sorted(self._groups.items()):
+            fwhm = np.concatenate(group['fwhm'])
+            fwhm = fwhm[np.isfinite(fwhm)]
+            nsources = np.concatenate(group['nsources'])
+            mjd = np.concatenate(group['mjd'])
+            timed = np.isfinite(mjd)
+            rows.append(key + (
+                group['nframes'],
+                group['nfailed'],
+                np.median(nsources) if len(nsources) else np.nan,
+                nsources.min() if len(nsources) else -1,
+                nsources.max() if len(nsources) else -1,
+                _slope_per_hour(mjd[timed], nsources[timed]),
+                np.median(fwhm) if len(fwhm) else np.nan,
+                group['nfocus_failed'] / group['nfocus'] if group['nfocus'] else np.nan,
+                group['nheader_failed'],
+                mjd[timed].min() if timed.any() else np.nan,
+                mjd[timed].max() if timed.any() else np.nan,
+            ))
+        names = self.by + ['nframes', 'nfailed', 'nsources_median', 'nsources_min',
+                           'nsources_max', 'nsources_slope', 'fwhm_median', 'focus_fail_rate',
+                           'header_failures', 'mjd_start', 'mjd_end']
+        if not rows:
+            return Table(names=names)
+        return Table(rows=rows, names=names)
+
+
+def nightly_summary(results: list[dict] | Table | QAStore, by: str | list[str] = 'NIGHT') -> Table:
+    """
+    Aggregate QA results per night (or per any combination of header keys)
+
+    Parameters
+    ----------
+    results : iterable of dict or astropy.table.Table or QAStore
+        per-frame QA results
+    by : str or iterable of str
+        keys used to group the frames, e.g. ['NIGHT', 'FILTER']
+
+    Returns
+    -------
+    table : astropy.table.Table
+        see `QASummary.table`
+    """
+    summary = QASummary(by=by)
+    if isinstance(results, QAStore):
+        summary.update_from_store(results)
+    else:
+        summary.update(results)
+    return summary.table()